@@ -0,0 +1,5 @@
+# Root-level conftest so tests can import the top-level modules (helper, utils, ...)
+import os
+
+# dependencies.py refuses to import without an API key
+os.environ.setdefault("API_KEY", "test-key")
@@ -1,9 +1,21 @@
 
 # helper.py
-from typing import List, Dict, Optional, Iterable, Any
+from typing import List, Dict, Optional, Iterable, Iterator, Any, AsyncIterator, Callable, Tuple
 from collections import Counter
 from datetime import datetime
-import json
+import io
+
+try:
+    import orjson
+
+    def _json_dumps(value: Any) -> str:
+        # OPT_NON_STR_KEYS: accept int/other dict keys like json.dumps does
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+except ImportError:
+    import json
+
+    def _json_dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False)
 
 # Preferred columns (shown first when present)
 PRIORITY_COLUMNS: List[str] = [
@@ -20,23 +32,37 @@ PRIORITY_COLUMNS: List[str] = [
     "Status",
 ]
 
+# Keys of the invoice dicts built in routers/invoice.py (kept in sync by hand)
+FIXED_INVOICE_COLUMNS: List[str] = [
+    "Supplier Name",
+    "Supplier SECS",
+    "Vendor Code",
+    "Invoice Number",
+    "Invoice Date",
+    "Payment Due Date",
+    "Document Type",
+    "Amount",
+    "Currency",
+    "Remark",
+    "Status",
+]
+
 # Exclude noisy/internal keys if needed
 EXCLUDE_KEYS: set[str] = set()
 
-def _fmt_date(s: Optional[str]) -> str:
+def _fmt_date(s: Any) -> str:
     """Format ISO-like date strings as DD-MMM-YYYY."""
     if not s:
         return ""
-    fmts = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ")
-    for f in fmts:
-        try:
-            dt = datetime.strptime(str(s)[:len(f)], f)
-            return dt.strftime("%d-%b-%Y")
-        except ValueError:
-            continue
-    return str(s)
-
-def _fmt_amount(x: Optional[object]) -> str:
+    text = str(s)
+    try:
+        # Covers YYYY-MM-DD, YYYY-MM-DDTHH:MM:SS and ...SS.fffZ in one C call
+        dt = datetime.fromisoformat(text[:-1] if text.endswith("Z") else text)
+    except ValueError:
+        return text
+    return dt.strftime("%d-%b-%Y")
+
+def _fmt_amount(x: Any) -> str:
     """Format numeric amount with thousands separators and 2 decimals."""
     try:
         return f"{float(x):,.2f}"
@@ -44,12 +70,25 @@ def _fmt_amount(x: Optional[object]) -> str:
         return "" if x is None else str(x)
 
 # Column-specific formatters
-COLUMN_FORMATTERS = {
+Formatter = Callable[[Any], str]
+
+COLUMN_FORMATTERS: Dict[str, Formatter] = {
     "Invoice Date": _fmt_date,
     "Payment Due Date": _fmt_date,
     "Amount": _fmt_amount,
 }
 
+def _cell_text(formatted: Any) -> str:
+    """Turn an already-formatted value into a Markdown-safe cell string."""
+    # Ensure final text
+    if isinstance(formatted, (dict, list)):
+        text = _json_dumps(formatted)
+    else:
+        text = "" if formatted is None else str(formatted)
+
+    # Markdown-safe: strip newlines, escape pipes
+    return text.replace("\n", " ").strip().replace("|", "\\|")
+
 def coerce_to_text(col: str, raw: Any) -> str:
     """
     Format value by column, then ensure it's a safe Markdown string.
@@ -58,39 +97,38 @@ def coerce_to_text(col: str, raw: Any) -> str:
     - Applies COLUMN_FORMATTERS if present (CALLS the function)
     - Escapes pipes to avoid breaking Markdown tables
     """
-    # Apply formatter if configured for this column (CALL the function)
-    if col in COLUMN_FORMATTERS:
-        try:
-            formatted = COLUMN_FORMATTERS(col)
-        except Exception:
-            formatted = raw
-    else:
-        formatted = raw
-
-    # Ensure final text
-    if isinstance(formatted, (dict, list)):
-        text = json.dumps(formatted, ensure_ascii=False)
-    else:
-        text = "" if formatted is None else str(formatted)
-
-    # Markdown-safe: strip newlines, escape pipes
-    return text.replace("\n", " ").strip().replace("|", "\\|")
+    fmt = COLUMN_FORMATTERS.get(col)
+    formatted = fmt(raw) if fmt is not None else raw
+    return _cell_text(formatted)
 
 def derive_columns(
     rows: Iterable[Dict],
     priority: Optional[List[str]] = None,
     exclude: Optional[Iterable[str]] = None,
     max_cols: Optional[int] = None,
+    assume_schema: bool = False,
 ) -> List[str]:
     """
     Derive dynamic headers from the union of keys across all rows.
     - Priority columns that exist appear first.
     - Remaining columns sorted by frequency (desc) then name (asc).
     - Excludes keys and caps number of columns if max_cols is set.
+    - assume_schema=True skips the scan and treats FIXED_INVOICE_COLUMNS as
+      the keys present, for rows known to have the router's invoice shape.
+      Ordering (priority, exclude, max_cols) is applied the same way.
     """
     priority = priority or PRIORITY_COLUMNS
     exclude_set = set(exclude or EXCLUDE_KEYS)
 
+    if assume_schema:
+        present = [c for c in FIXED_INVOICE_COLUMNS if c not in exclude_set]
+        present_set = set(present)
+        cols = [c for c in priority if c in present_set]
+        cols_set = set(cols)
+        # Every key occurs in every row, so the rest is alphabetical
+        cols.extend(sorted((k for k in present if k not in cols_set), key=str.lower))
+        return cols[:max_cols] if max_cols else cols
+
     freq: Counter = Counter()
     for r in rows:
         freq.update(k for k in r.keys() if k not in exclude_set)
@@ -105,7 +143,8 @@ def derive_columns(
     cols: List[str] = [c for c in priority if c in present_keys]
 
     # Remaining columns by frequency then alphabetical
-    rest = [k for k in present_keys if k not in cols]
+    cols_set = set(cols)
+    rest = [k for k in present_keys if k not in cols_set]
     rest.sort(key=lambda k: (-freq[k], k.lower()))
     cols.extend(rest)
 
@@ -113,6 +152,54 @@ def derive_columns(
         cols = cols[:max_cols]
     return cols
 
+def _column_formatters(columns: List[str]) -> List[Tuple[str, Optional[Formatter]]]:
+    """Pair each column with its formatter, resolved once per render."""
+    return [(c, COLUMN_FORMATTERS.get(c)) for c in columns]
+
+def _markdown_header(columns: List[str]) -> List[str]:
+    """Pieces of the header row plus separator row, without a trailing newline."""
+    return ["| ", " | ".join(columns), " |\n|", "|".join(["---"] * len(columns)), "|"]
+
+def _markdown_row(r: Dict, col_fmts: List[Tuple[str, Optional[Formatter]]]) -> List[str]:
+    """Pieces of one table row, preceded by its newline."""
+    cells: List[str] = []
+    for col, fmt in col_fmts:
+        raw = r.get(col, "")
+        # ✅ Always coerce to text; prevents dict/list or function leaking into join()
+        cells.append(_cell_text(fmt(raw) if fmt is not None else raw))
+    return ["\n| ", " | ".join(cells), " |"]
+
+def _pager_text(total: int, page: int, page_size: int) -> str:
+    """Footer shown under the table (empty-result note or page position)."""
+    if total == 0:
+        return "_No invoices found._"
+    pages = (total + page_size - 1) // page_size
+    return f"_Page **{page}** of **{pages}** · {total} rows_"
+
+def page_bounds(total: int, page: int, page_size: int) -> Tuple[int, int]:
+    """[start, end) offsets of a 1-based page within `total` rows."""
+    start = max((page - 1) * page_size, 0)
+    return start, min(start + page_size, total)
+
+def _markdown_chunks(
+    page_rows: List[Dict],
+    columns: List[str],
+    total: int,
+    page: int,
+    page_size: int,
+    pager_hint: bool,
+) -> Iterator[List[str]]:
+    """
+    Header, one chunk per row of the page, then the pager hint. Each chunk is
+    a list of string pieces so callers can write them without concatenating.
+    """
+    yield _markdown_header(columns)
+    col_fmts = _column_formatters(columns)
+    for r in page_rows:
+        yield _markdown_row(r, col_fmts)
+    if total == 0 or pager_hint:
+        yield ["\n\n", _pager_text(total, page, page_size)]
+
 def to_markdown_dynamic(
     invoices: List[Dict],
     columns: List[str],
@@ -123,33 +210,47 @@ def to_markdown_dynamic(
     """
     Render a Markdown table with provided dynamic columns and paging.
     """
-    lines: List[str] = []
-    # Header
-    lines.append("| " + " | ".join(columns) + " |")
-    lines.append("|" + "|".join(["---"] * len(columns)) + "|")
-
+    buf = io.StringIO()
     total = len(invoices)
-    start = max((page - 1) * page_size, 0)
-    end = min(start + page_size, total)
-    subset = invoices[start:end]
-
-    # Rows
-    for r in subset:
-        cells: List[str] = []
-        for col in columns:
-            raw = r.get(col, "")
-            # ✅ Always coerce to text; prevents dict/list or function leaking into join()
-            cells.append(coerce_to_text(col, raw))
-        lines.append("| " + " | ".join(cells) + " |")
-
-    # Pager hint
-    if total == 0:
-        lines.append("\n_No invoices found._")
-    elif pager_hint:
-        pages = (total + page_size - 1) // page_size
-        lines.append(f"\n_Page **{page}** of **{pages}** · {total} rows_")
+    start, end = page_bounds(total, page, page_size)
+    for pieces in _markdown_chunks(invoices[start:end], columns, total, page, page_size, pager_hint):
+        buf.writelines(pieces)
+    return buf.getvalue()
+
+async def iter_markdown_page(
+    page_rows: List[Dict],
+    columns: List[str],
+    total: int,
+    page: int,
+    page_size: int,
+    summary: Optional[Dict] = None,
+    pager_hint: bool = True,
+) -> AsyncIterator[str]:
+    """
+    Stream one already-sliced page (`page_rows`, taken with page_bounds out of
+    `total` rows) plus the summary, one row per chunk.
+    `page` / `page_size` only feed the pager hint.
+    """
+    for pieces in _markdown_chunks(page_rows, columns, total, page, page_size, pager_hint):
+        yield "".join(pieces)
+    if summary:
+        yield summary_markdown_dynamic(summary)
 
-    return "\n".join(lines)
+def iter_markdown(
+    invoices: List[Dict],
+    columns: List[str],
+    page: int,
+    page_size: int,
+    summary: Optional[Dict] = None,
+    pager_hint: bool = True,
+) -> AsyncIterator[str]:
+    """
+    Stream to_markdown_dynamic's table plus the summary, one row per chunk,
+    so the body never has to be built in memory.
+    """
+    total = len(invoices)
+    start, end = page_bounds(total, page, page_size)
+    return iter_markdown_page(invoices[start:end], columns, total, page, page_size, summary, pager_hint)
 
 def summary_markdown_dynamic(summary: Dict) -> str:
     """Render a compact Markdown summary below the table."""
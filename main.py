@@ -1,7 +1,31 @@
+from contextlib import asynccontextmanager
+
+import httpx
 from fastapi import FastAPI
-from routers import invoice
+from fastapi.middleware.gzip import GZipMiddleware
+from routers.invoice import router as invoice_router
+from responses import FastJSONResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared, keep-alive client for calls to the upstream data API
+    async with httpx.AsyncClient(
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=32),
+    ) as client:
+        app.state.http = client
+        try:
+            yield
+        finally:
+            del app.state.http
+
+
+app = FastAPI(title="Invoice Status API", default_response_class=FastJSONResponse, lifespan=lifespan)
 
-app = FastAPI(title="Invoice Status API")
+# Invoice listings (JSON and Markdown) are repetitive text and compress well;
+# streamed Markdown rows are flushed as separate gzip fragments
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Include the router for all invoice-related endpoints
-app.include_router(invoice.router)
\ No newline at end of file
+app.include_router(invoice_router)
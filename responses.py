@@ -0,0 +1,17 @@
+# responses.py
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse encoded with orjson (FastAPI's ORJSONResponse is deprecated)."""
+
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+__all__ = ["FastJSONResponse"]
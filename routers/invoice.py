@@ -1,30 +1,72 @@
 
 # routers/invoice.py
-from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.responses import JSONResponse, PlainTextResponse
-import requests
-from typing import Optional, Dict, List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import httpx
+from itertools import islice
+from typing import Any, Optional, Dict, List
 
 from dependencies import get_api_key
-from models import InvoiceStatusRequest, ResponseSchema, InvoiceSchema
-from utils import normalize, parse_date, get_remark_and_status
+from models import InvoiceStatusRequest
+from responses import FastJSONResponse
+from utils import parse_date, get_remark_and_status, get_financial_data, invalidate_financial_data
 
 # NEW: import helper functions for Markdown
-from helper import derive_columns, to_markdown_dynamic, summary_markdown_dynamic
+from helper import derive_columns, iter_markdown, iter_markdown_page, page_bounds
+
+__all__ = ["router"]
 
 router = APIRouter()
 
+def _s(d: Dict, k: str, default: str = "") -> str:
+    """Field as text; only a missing/None value falls back to `default` (0 stays "0")."""
+    v = d.get(k)
+    if v is None:
+        return default
+    return v if type(v) is str else str(v)
+
+def _v(d: Dict, k: str, default: Any = "") -> Any:
+    """Field as-is; only a missing/None value falls back to `default` (0 stays 0)."""
+    v = d.get(k)
+    return default if v is None else v
+
+def _amount(row: Dict) -> float:
+    """Cached absolute amount; a non-numeric upstream amount fails this request only."""
+    amt = row["_amt"]
+    if amt is None:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Invalid amount {row.get('Amount in Doc. Curr.')!r} for invoice {row['_ref']} in upstream data."
+        )
+    return amt
+
+def _http_client(request: Request) -> httpx.AsyncClient:
+    """Upstream client opened by the app lifespan; 503 if it never started."""
+    client = getattr(request.app.state, "http", None)
+    if client is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Data API client is not initialised."
+        )
+    return client
+
 @router.get("/")
 async def get_root():
     return {"message": "Welcome to the Invoice Status API!"}
 
+@router.post("/data/refresh")
+async def refresh_data(api_key: str = Depends(get_api_key)):
+    invalidate_financial_data()
+    return {"message": "Upstream data cache cleared."}
+
 @router.post(
     "/invoice/status",
     # Optional: remove response_model for multi-format (JSON + Markdown)
     # response_model=ResponseSchema,
-    response_class=JSONResponse,
+    response_class=FastJSONResponse,
 )
 async def invoice_status(
+    request: Request,
     request_data: InvoiceStatusRequest,
     api_key: str = Depends(get_api_key),
     # NEW: query params to control format & paging
@@ -52,66 +94,68 @@ async def invoice_status(
             detail="start_date cannot be after end_date."
         )
 
-    data_api_url = "http://127.0.0.1:8001/data"
     try:
-        response = requests.get(data_api_url, timeout=30)
-        response.raise_for_status()
-        financial_data = response.json()
-    except requests.exceptions.RequestException as e:
+        _, by_account = await get_financial_data(_http_client(request))
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=503,
             detail=f"Failed to connect to data API: {e}"
         )
+    except ValueError as e:
+        # Upstream body is not valid JSON (orjson / json decode errors)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Invalid response from data API: {e}"
+        )
 
+    # Only this account's IL/SP rows, pre-indexed at cache refresh
+    account_rows = by_account.get(account, [])
     invoices_out: List[Dict] = []
 
     # Case 1: Specific invoice
     if inv:
         invoice_rows = [
-            row for row in financial_data
-            if (row.get("Account")) == (account)
-            and normalize(row.get("Reference key 3")) == inv
-            and normalize(row.get("Document type")) in ["IL", "SP"]
+            row for row in account_rows
+            if row["_ref"] == inv
         ]
 
         if not invoice_rows:
             if format == "md":
                 return PlainTextResponse(content=f"**Invoice `{inv}` is under process**", media_type="text/plain")
-            return JSONResponse(content=f"Invoice {inv} is under process")
+            return FastJSONResponse(content=f"Invoice {inv} is under process")
             
+        il_amount = sp_amount = 0
+        status_first = None
         for row in invoice_rows:
+            dt, amt = row["_dt"], _amount(row)
             remark, status = get_remark_and_status(row)
+            if status_first is None:
+                status_first = status
+            if dt == "IL":
+                il_amount += amt
+            else:
+                sp_amount += amt
             invoices_out.append({
-                "Supplier Name": str(row.get("Vendor name") or ""),
-                "Supplier SECS": (row.get("Account") or ""),
-                "Vendor Code": str(row.get("Vendor") or ""),
+                "Supplier Name": _s(row, "Vendor name"),
+                "Supplier SECS": _v(row, "Account"),
+                "Vendor Code": _s(row, "Vendor"),
                 "Invoice Number": inv,
-                "Invoice Date": str(row.get("Entry Date") or ""),
-                "Payment Due Date": str(row.get("Payment Date") or ""),
-                "Document Type": normalize(row.get("Document type")),
-                "Amount": abs(float(row.get("Amount in Doc. Curr.") or 0)),
-                "Currency": str(row.get("Document Currency") or ""),
+                "Invoice Date": _s(row, "Entry Date"),
+                "Payment Due Date": _s(row, "Payment Date"),
+                "Document Type": dt,
+                "Amount": amt,
+                "Currency": _s(row, "Document Currency"),
                 "Remark": remark,
                 "Status": status
             })
 
-        il_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) for r in invoice_rows if normalize(r.get("Document type")) == "IL")
-        sp_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) for r in invoice_rows if normalize(r.get("Document type")) == "SP")
         currency = invoice_rows[0].get("Document Currency") or ""
-        _, status_first = get_remark_and_status(invoice_rows[0])
-        amount_due_calc = il_amount - sp_amount
         if status_first == "Paid":
-            paid_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) 
-                            for r in invoice_rows if normalize(r.get("Document type")) == "IL")
+            paid_amount = il_amount
             due_amount = 0
         else:
-            il_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) 
-                            for r in invoice_rows if normalize(r.get("Document type")) == "IL")
-            sp_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) 
-                            for r in invoice_rows if normalize(r.get("Document type")) == "SP")
-            amount_due_calc = il_amount - sp_amount
             paid_amount = 0
-            due_amount = amount_due_calc
+            due_amount = il_amount - sp_amount
 
         summary = {
             "Amount Paid": paid_amount,
@@ -121,88 +165,96 @@ async def invoice_status(
 
         # Markdown output (specific invoice)
         if format == "md":
-            columns = derive_columns(invoices_out, max_cols=max_cols)
-            md = to_markdown_dynamic(invoices_out, columns, page=page, page_size=page_size)
-            md += summary_markdown_dynamic(summary)
-            return PlainTextResponse(content=md, media_type="text/plain")
+            columns = derive_columns(invoices_out, max_cols=max_cols, assume_schema=True)
+            return StreamingResponse(
+                iter_markdown(invoices_out, columns, page=page, page_size=page_size, summary=summary),
+                media_type="text/plain",
+                headers={"X-Accel-Buffering": "no"},
+            )
 
         return {"invoices": invoices_out, "summary": summary}
 
     # Case 2: All invoices
     else:
-        account_invoices: Dict[str, List[Dict]] = {}
-        for row in financial_data:
-            if (row.get("Account")) != (account):
-                continue
-            if normalize(row.get("Document type")) not in ["IL", "SP"]:
-                continue
-            invoice_date_str = row.get("Entry Date")
-            if not invoice_date_str:
-                continue
-            try:
-                invoice_dt = parse_date(invoice_date_str)
-            except HTTPException:
+        # One pass: filter, group by invoice number and accumulate IL/SP totals
+        account_invoices: Dict[str, Dict] = {}
+        for row in account_rows:
+            invoice_dt = row["_entry_dt"]
+            if invoice_dt is None:
                 continue
             if start_dt and invoice_dt < start_dt:
                 continue
             if end_dt and invoice_dt > end_dt:
                 continue
-            inv_no = normalize(row.get("Reference key 3"))
+            inv_no = row["_ref"]
             if not inv_no:
                 continue
-            account_invoices.setdefault(inv_no, []).append(row)
+            group = account_invoices.get(inv_no)
+            if group is None:
+                group = account_invoices[inv_no] = {"il": 0.0, "sp": 0.0, "base": row}
+            if row["_dt"] == "IL":
+                group["il"] += _amount(row)
+            else:
+                group["sp"] += _amount(row)
 
-        invoices_out = []
-        for inv_no, rows in account_invoices.items():
-            il_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) for r in rows if normalize(r.get("Document type")) == "IL")
-            sp_amount = sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) for r in rows if normalize(r.get("Document type")) == "SP")
-            base_row = rows[0] if rows else {}
-            remark, status = get_remark_and_status(base_row)
+        # Status and amount are needed for every group to build the summary
+        due_count = paid_count = 0
+        total_due_amount = total_paid_amount = 0
+        for group in account_invoices.values():
+            il_amount = group["il"]
+            remark, status = get_remark_and_status(group["base"])
             if status == "Paid":
                 amount_due = il_amount
+                paid_count += 1
+                total_paid_amount += il_amount
             else:
-                amount_due = il_amount - sp_amount
+                amount_due = il_amount - group["sp"]
+                if status == "Due":
+                    due_count += 1
+                    total_due_amount += amount_due
+            group["remark"], group["status"], group["amount"] = remark, status, amount_due
+
+        summary = {
+            "invoice_count": len(account_invoices),
+            "due_count": due_count,
+            "paid_count": paid_count,
+            "total_due_amount": total_due_amount,
+            "total_paid_amount": total_paid_amount,
+        }
 
+        # Markdown only renders one page, so only build that page's rows
+        groups = account_invoices.items()
+        if format == "md":
+            start, end = page_bounds(len(account_invoices), page, page_size)
+            groups = islice(groups, start, end)
+
+        invoices_out = []
+        for inv_no, group in groups:
+            base_row = group["base"]
             invoices_out.append({
-                "Supplier Name": str(base_row.get("Vendor name") or ""),
-                "Supplier SECS": (base_row.get("Account") or ""),
-                "Vendor Code": str(base_row.get("Vendor") or ""),
+                "Supplier Name": _s(base_row, "Vendor name"),
+                "Supplier SECS": _v(base_row, "Account"),
+                "Vendor Code": _s(base_row, "Vendor"),
                 "Invoice Number": inv_no,
-                "Invoice Date": str(base_row.get("Entry Date") or ""),
-                "Payment Due Date": str(base_row.get("Payment Date") or ""),
+                "Invoice Date": _s(base_row, "Entry Date"),
+                "Payment Due Date": _s(base_row, "Payment Date"),
                 "Document Type": "Aggregated",
-                "Amount": amount_due,
-                "Currency": str(base_row.get("Document Currency") or ""),
-                "Remark": remark,
-                "Status": status
+                "Amount": group["amount"],
+                "Currency": _s(base_row, "Document Currency"),
+                "Remark": group["remark"],
+                "Status": group["status"]
             })
-        summary = {
-            "invoice_count": len(invoices_out),
-            "due_count": sum(1 for i in invoices_out if i.get("Status") == "Due"),
-            "paid_count": sum(1 for i in invoices_out if i.get("Status") == "Paid"),
-            "total_due_amount": sum(
-                (
-                    sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) 
-                        for r in rows if normalize(r.get("Document type")) == "IL")
-                    -
-                    sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) 
-                        for r in rows if normalize(r.get("Document type")) == "SP")
-                )
-                for inv_no, rows in account_invoices.items()
-                if get_remark_and_status(rows[0])[1] == "Due"
-            ),
-            "total_paid_amount": sum(
-                sum(abs(float(r.get("Amount in Doc. Curr.") or 0)) for r in rows if normalize(r.get("Document type")) == "IL")
-                for inv_no, rows in account_invoices.items()
-                if get_remark_and_status(rows[0])[1] == "Paid"
-            ),
-        }
 
         # Markdown output (all invoices)
         if format == "md":
-            columns = derive_columns(invoices_out, max_cols=max_cols)
-            md = to_markdown_dynamic(invoices_out, columns, page=page, page_size=page_size)
-            md += summary_markdown_dynamic(summary)
-            return PlainTextResponse(content=md, media_type="text/plain")
+            columns = derive_columns(invoices_out, max_cols=max_cols, assume_schema=bool(account_invoices))
+            return StreamingResponse(
+                iter_markdown_page(
+                    invoices_out, columns, total=len(account_invoices),
+                    page=page, page_size=page_size, summary=summary,
+                ),
+                media_type="text/plain",
+                headers={"X-Accel-Buffering": "no"},
+            )
 
         return {"invoices": invoices_out, "summary": summary}
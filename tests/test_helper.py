@@ -0,0 +1,64 @@
+import asyncio
+
+from helper import (
+    _fmt_date,
+    coerce_to_text,
+    derive_columns,
+    iter_markdown,
+    summary_markdown_dynamic,
+    to_markdown_dynamic,
+)
+
+
+def test_fmt_date_iso_shapes():
+    assert _fmt_date("2024-01-02") == "02-Jan-2024"
+    assert _fmt_date("2024-01-02T10:11:12") == "02-Jan-2024"
+    assert _fmt_date("2024-01-02T10:11:12.123Z") == "02-Jan-2024"
+
+
+def test_fmt_date_passthrough():
+    assert _fmt_date(None) == ""
+    assert _fmt_date("") == ""
+    assert _fmt_date("not a date") == "not a date"
+
+
+def test_coerce_to_text_applies_column_formatters():
+    assert coerce_to_text("Amount", 1234.5) == "1,234.50"
+    assert coerce_to_text("Amount", "n/a") == "n/a"
+    assert coerce_to_text("Invoice Date", "2024-03-05") == "05-Mar-2024"
+    assert coerce_to_text("Payment Due Date", None) == ""
+
+
+def test_coerce_to_text_markdown_safety():
+    assert coerce_to_text("Remark", "a|b\nc") == "a\\|b c"
+    assert coerce_to_text("Remark", None) == ""
+    assert coerce_to_text("Remark", 0) == "0"
+    assert coerce_to_text("Remark", {"k": "v"}) in ('{"k":"v"}', '{"k": "v"}')
+
+
+def _collect(agen):
+    async def run():
+        return "".join([chunk async for chunk in agen])
+    return asyncio.run(run())
+
+
+def test_iter_markdown_matches_to_markdown_dynamic():
+    rows = [{"Invoice Number": str(i), "Amount": i} for i in range(7)]
+    columns = derive_columns(rows)
+    summary = {"invoice_count": 7}
+    for page in (1, 2, 4):
+        expected = (
+            to_markdown_dynamic(rows, columns, page=page, page_size=3)
+            + summary_markdown_dynamic(summary)
+        )
+        streamed = _collect(iter_markdown(rows, columns, page=page, page_size=3, summary=summary))
+        assert streamed == expected
+
+
+def test_to_markdown_dynamic_empty():
+    md = to_markdown_dynamic([], ["Amount"], page=1, page_size=10)
+    assert md == "| Amount |\n|---|\n\n_No invoices found._"
+
+
+def test_coerce_to_text_non_str_dict_keys():
+    assert coerce_to_text("X", {1: "a"}) in ('{"1":"a"}', '{"1": "a"}')
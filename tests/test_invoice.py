@@ -0,0 +1,140 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from helper import derive_columns, summary_markdown_dynamic, to_markdown_dynamic
+from main import app
+from utils import invalidate_financial_data
+
+HEADERS = {"x-api-key": "test-key"}
+
+
+def _row(account, ref, amount, doc_type="IL", entry_date="2024-01-02"):
+    return {
+        "Account": account,
+        "Document type": doc_type,
+        "Reference key 3": ref,
+        "Amount in Doc. Curr.": amount,
+        "Entry Date": entry_date,
+        "Vendor name": "ACME",
+        "Vendor": "V1",
+        "Document Currency": "EUR",
+    }
+
+
+@pytest.fixture
+def make_client():
+    """Build a TestClient whose upstream /data returns the given rows."""
+    def make(rows):
+        invalidate_financial_data()
+        # No lifespan: the startup hook would replace this mock with a real client
+        app.state.http = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json=rows))
+        )
+        return TestClient(app)
+
+    yield make
+    invalidate_financial_data()
+
+
+def test_malformed_amount_only_fails_its_account(make_client):
+    client = make_client([
+        _row(1, "GOOD", 100),
+        _row(2, "BAD", "1,234.00"),
+    ])
+
+    ok = client.post("/invoice/status", json={"account": 1}, headers=HEADERS)
+    assert ok.status_code == 200
+    assert ok.json()["summary"]["total_due_amount"] == 100
+
+    bad = client.post("/invoice/status", json={"account": 2}, headers=HEADERS)
+    assert bad.status_code == 502
+    assert "BAD" in bad.json()["detail"]
+
+
+def test_zero_account_is_not_blanked(make_client):
+    client = make_client([_row(0, "ZERO", 10)])
+
+    resp = client.post("/invoice/status", json={"account": 0, "inv": "ZERO"}, headers=HEADERS)
+    assert resp.status_code == 200
+    assert resp.json()["invoices"][0]["Supplier SECS"] == 0
+
+
+@pytest.mark.parametrize("page", [1, 2, 3, 9])
+def test_markdown_pages_match_full_list_slicing(make_client, page):
+    # 7 invoices, two of them with a partial payment (SP) row
+    rows = [_row(1, f"INV{i}", 100 + i) for i in range(7)]
+    rows += [_row(1, "INV2", 30, doc_type="SP"), _row(1, "INV5", 5, doc_type="SP")]
+    client = make_client(rows)
+
+    full = client.post("/invoice/status", json={"account": 1}, headers=HEADERS).json()
+    resp = client.post(
+        "/invoice/status",
+        params={"format": "md", "page": page, "page_size": 3},
+        json={"account": 1},
+        headers=HEADERS,
+    )
+    assert resp.status_code == 200
+
+    # What the renderer produced before pagination moved into the router
+    invoices = full["invoices"]
+    columns = derive_columns(invoices)
+    expected = (
+        to_markdown_dynamic(invoices, columns, page=page, page_size=3)
+        + summary_markdown_dynamic(full["summary"])
+    )
+    assert resp.text == expected
+    assert full["summary"]["invoice_count"] == 7
+    assert full["summary"]["total_due_amount"] == sum(100 + i for i in range(7)) - 35
+
+
+def test_gzip_applies_to_json_and_markdown(make_client):
+    client = make_client([_row(1, f"INV{i}", i) for i in range(40)])
+    gzip_headers = {**HEADERS, "Accept-Encoding": "gzip"}
+
+    js = client.post("/invoice/status", json={"account": 1}, headers=gzip_headers)
+    assert js.headers.get("content-encoding") == "gzip"
+    assert js.json()["summary"]["invoice_count"] == 40
+
+    md = client.post("/invoice/status", params={"format": "md"}, json={"account": 1}, headers=gzip_headers)
+    assert md.headers.get("content-encoding") == "gzip"
+    assert md.text.startswith("| Supplier Name |")
+
+
+def test_lifespan_opens_and_closes_http_client(make_client):
+    del app.state.http
+    with TestClient(app):
+        assert isinstance(app.state.http, httpx.AsyncClient)
+    assert not hasattr(app.state, "http")
+
+
+def test_missing_http_client_is_503():
+    invalidate_financial_data()
+    if hasattr(app.state, "http"):
+        del app.state.http
+    resp = TestClient(app).post("/invoice/status", json={"account": 1}, headers=HEADERS)
+    assert resp.status_code == 503
+
+
+def test_malformed_upstream_body_is_503():
+    invalidate_financial_data()
+    app.state.http = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"not json"))
+    )
+    resp = TestClient(app).post("/invoice/status", json={"account": 1}, headers=HEADERS)
+    assert resp.status_code == 503
+    invalidate_financial_data()
+
+
+@pytest.mark.parametrize("body", [{"account": 1}, {"account": 1, "inv": "INV1"}])
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"max_cols": 3},
+    {"priority": ["Status", "Amount"]},
+    {"priority": ["Document Type", "Remark"], "exclude": ["Amount"]},
+])
+def test_assume_schema_matches_scan_of_router_output(make_client, body, kwargs):
+    client = make_client([_row(1, "INV1", 10), _row(1, "INV2", 20)])
+    invoices = client.post("/invoice/status", json=body, headers=HEADERS).json()["invoices"]
+    assert invoices
+    assert derive_columns(invoices, assume_schema=True, **kwargs) == derive_columns(invoices, **kwargs)
@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+
+import utils
+from utils import get_financial_data, invalidate_financial_data
+
+ROWS = [
+    {"Account": 1, "Document type": "IL", "Reference key 3": "INV1",
+     "Amount in Doc. Curr.": 100, "Entry Date": "2024-01-02"},
+]
+
+
+@pytest.fixture
+def upstream():
+    """AsyncClient backed by a fake /data endpoint that counts its calls."""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, json=ROWS)
+
+    invalidate_financial_data()
+    yield httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+    invalidate_financial_data()
+
+
+def test_cache_hit_within_ttl(upstream):
+    client, calls = upstream
+
+    async def run():
+        first = await get_financial_data(client, ttl=60)
+        second = await get_financial_data(client, ttl=60)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert second is first
+    rows, by_account = first
+    assert [r["_ref"] for r in by_account[1]] == ["INV1"]
+
+
+def test_cache_expires_after_ttl(upstream, monkeypatch):
+    client, calls = upstream
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+
+    async def run():
+        await get_financial_data(client, ttl=10)
+        now[0] += 5
+        await get_financial_data(client, ttl=10)
+        assert len(calls) == 1
+        now[0] += 10
+        await get_financial_data(client, ttl=10)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_invalidate_forces_refetch(upstream):
+    client, calls = upstream
+
+    async def run():
+        await get_financial_data(client, ttl=60)
+        invalidate_financial_data()
+        await get_financial_data(client, ttl=60)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_concurrent_refreshes_are_coalesced(upstream):
+    client, calls = upstream
+
+    async def run():
+        await asyncio.gather(*(get_financial_data(client, ttl=60) for _ in range(5)))
+
+    asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_index_tolerates_malformed_rows():
+    rows = [
+        {"Account": 1, "Document type": "IL", "Reference key 3": "GOOD",
+         "Amount in Doc. Curr.": "-250.5", "Entry Date": "2024-01-02"},
+        {"Account": 2, "Document type": "SP", "Reference key 3": "BAD",
+         "Amount in Doc. Curr.": "1,234.00", "Entry Date": "02/01/2024"},
+        {"Account": 2, "Document type": "XX", "Reference key 3": "SKIP"},
+    ]
+    by_account = utils.index_financial_data(rows)
+
+    (good,) = by_account[1]
+    assert good["_amt"] == 250.5
+    assert good["_entry_dt"].isoformat() == "2024-01-02T00:00:00"
+
+    (bad,) = by_account[2]
+    assert bad["_amt"] is None
+    assert bad["_entry_dt"] is None
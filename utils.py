@@ -1,19 +1,62 @@
+import asyncio
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Optional
+
+import httpx
+
 from fastapi import HTTPException
 from datetime import datetime, timedelta
 
+try:
+    import orjson
+
+    def _json_loads(content: bytes) -> Any:
+        return orjson.loads(content)
+except ImportError:
+    import json
+
+    def _json_loads(content: bytes) -> Any:
+        return json.loads(content)
+
+DATA_API_URL = "http://127.0.0.1:8001/data"
+DATA_CACHE_TTL = 10.0  # seconds
+
+# Document types that make up an invoice (IL = invoice line, SP = payment)
+_IL_SP = frozenset(("IL", "SP"))
+
+# Last upstream payload; the lock coalesces concurrent refreshes into one fetch
+_cache: dict[str, Any] = {"ts": 0.0, "data": None, "lock": asyncio.Lock()}
+
 def normalize(value):
+    # Upstream values are almost always str; skip the str() call for them
+    if type(value) is str:
+        return value.strip()
     if value is None:
         return ""
     return str(value).strip()
 
-def parse_date(date_str: str) -> datetime:
+@lru_cache(maxsize=4096)
+def _parse_date_cached(date_str: str) -> Optional[datetime]:
+    """Parse YYYY-MM-DD, memoized per string; None if the format is invalid."""
     try:
+        # Canonical YYYY-MM-DD goes through the C-implemented fromisoformat;
+        # anything else (e.g. unpadded months) keeps the strptime semantics
+        if len(date_str) == 10 and date_str[4] == "-" and date_str[7] == "-":
+            return datetime.fromisoformat(date_str)
         return datetime.strptime(date_str, "%Y-%m-%d")
     except ValueError:
+        return None
+
+def parse_date(date_str: str) -> datetime:
+    parsed = _parse_date_cached(date_str)
+    if parsed is None:
         raise HTTPException(
             status_code=400,
             detail=f"Invalid date format: {date_str}. Use YYYY-MM-DD."
         )
+    return parsed
 
 def get_remark_and_status(invoice: dict) -> tuple[str, str]:
     """
@@ -37,21 +80,73 @@ def get_remark_and_status(invoice: dict) -> tuple[str, str]:
         return f"Invoice {ref_key} has been processed and sent to AP for payment.", "Due"
 
     if ref_key and clearing_doc and clearing_date and vendor_clearing_doc_no and bp_clearing_date_str:
+        paid_date = _parse_date_cached(bp_clearing_date_str)
+        if paid_date is not None and datetime.today() - paid_date <= timedelta(days=4):
+            return (
+                f"Payment for invoice {ref_key} has been processed on {bp_clearing_date_str}. "
+                f"It will be reflected in your bank account within 2 working days.",
+                "Paid"
+            )
+        return f"Payment for invoice {ref_key} has been processed on {bp_clearing_date_str}.", "Paid"
+
+    return f"Invoice {ref_key} found, but does not match defined status rules.", "Due"
+
+
+def index_financial_data(rows: list) -> dict[Any, list[dict]]:
+    """
+    Group invoice rows (IL/SP) by Account. Each indexed row gets its derived
+    fields cached so requests never re-parse them:
+    - `_dt`: normalized document type
+    - `_amt`: absolute amount, or None if the upstream value is not numeric
+      (the router rejects requests that touch such a row; other accounts
+      and invoices are unaffected)
+    - `_ref`: normalized invoice number (Reference key 3)
+    - `_entry_dt`: parsed Entry Date, or None if missing/invalid
+    """
+    by_account: dict[Any, list[dict]] = defaultdict(list)
+    for r in rows:
+        dt = normalize(r.get("Document type"))
+        if dt not in _IL_SP:
+            continue
+        r["_dt"] = dt
+        try:
+            r["_amt"] = abs(float(r.get("Amount in Doc. Curr.") or 0))
+        except (TypeError, ValueError):
+            r["_amt"] = None
+        r["_ref"] = normalize(r.get("Reference key 3"))
+        entry_date = r.get("Entry Date")
         try:
-            paid_date = parse_date(bp_clearing_date_str)
-            today = datetime.today()
-            if today - paid_date <= timedelta(days=4):
-                return (
-                    f"Payment for invoice {ref_key} has been processed on {bp_clearing_date_str}. "
-                    f"It will be reflected in your bank account within 2 working days.",
-                    "Paid"
-                )
-            else:
-                return (
-                    f"Payment for invoice {ref_key} has been processed on {bp_clearing_date_str}.",
-                    "Paid"
-                )
-        except Exception:
-            return f"Payment for invoice {ref_key} has been processed on {bp_clearing_date_str}.", "Paid"
-            
-    return f"Invoice {ref_key} found, but does not match defined status rules.", "Due"
\ No newline at end of file
+            r["_entry_dt"] = _parse_date_cached(entry_date) if entry_date else None
+        except TypeError:
+            r["_entry_dt"] = None
+        by_account[r.get("Account")].append(r)
+    return dict(by_account)
+
+
+async def get_financial_data(
+    client: httpx.AsyncClient, ttl: float = DATA_CACHE_TTL
+) -> tuple[list, dict[Any, list[dict]]]:
+    """
+    Return the upstream /data payload and its per-account index,
+    refetching at most once per `ttl` seconds.
+    Raises httpx.HTTPError if a refresh is needed and the upstream call fails.
+    """
+    if _cache["data"] is not None and time.monotonic() - _cache["ts"] < ttl:
+        return _cache["data"]
+
+    async with _cache["lock"]:
+        # Another request may have refreshed while we waited for the lock
+        if _cache["data"] is not None and time.monotonic() - _cache["ts"] < ttl:
+            return _cache["data"]
+        response = await client.get(DATA_API_URL)
+        response.raise_for_status()
+        rows = _json_loads(response.content)
+        _cache["data"] = (rows, index_financial_data(rows))
+        _cache["ts"] = time.monotonic()
+        return _cache["data"]
+
+
+def invalidate_financial_data() -> None:
+    """Drop the cached payload so the next request refetches it."""
+    _cache["data"] = None
+    _cache["ts"] = 0.0